@@ -8,39 +8,143 @@ to a Discord channel via a webhook.
 
 import os
 import sys
-import json
+import threading
+import bisect
+import functools
+import logging
 import re
+import orjson
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
 from datetime import datetime, timezone
-from typing import List, Dict, Optional
-import hashlib
-import pprint
+from email.utils import parsedate_to_datetime
+from types import MappingProxyType
+from typing import List, Dict, Optional, Tuple
 import time
 
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=2048)
+def parse_github_timestamp(value: str) -> float:
+    """Convert a GitHub ISO 8601 timestamp (e.g. 2024-01-01T12:00:00Z) to epoch seconds.
+
+    Relies on Python 3.11+, whose fromisoformat accepts the trailing 'Z' directly.
+    """
+    return datetime.fromisoformat(value).timestamp()
+
+
 class GitHubNotificationBot:
-    # Constants for formatting - Base type colors
-    TYPE_COLORS = {
+    # Constants for formatting - Base type colors (read-only, like the frozensets below)
+    TYPE_COLORS = MappingProxyType({
         'Issue': 0xdb2777,          # Pink
         'PullRequest': 0x8b5cf6,    # Violet
         'Release': 0xf59e0b,        # Amber
         'Discussion': 0x3b82f6,     # Blue
         'Commit': 0x6b7280,         # Gray
         'SecurityAdvisory': 0xff6b35 # Orange
-    }
+    })
+    DEFAULT_COLOR = 0x6b7280  # Gray - for types not listed above
     
     # State-specific colors (override base colors when applicable)
-    STATE_COLORS = {
+    STATE_COLORS = MappingProxyType({
         'open': 0x10b981,          # Green - for open issues/PRs
         'closed': 0xef4444,        # Red - for closed issues/PRs
         'merged': 0x8b5cf6,        # Purple - for merged PRs
         'failure': 0xef4444,       # Red - for failed workflows
         'success': 0x10b981,       # Green - for successful workflows
-    }
+    })
+
+    # Workflow conclusion -> embed color for completed CheckSuite/CheckRun notifications
+    CONCLUSION_COLORS = MappingProxyType({
+        'success': STATE_COLORS['success'],
+        'failure': STATE_COLORS['failure'],
+        'timed_out': STATE_COLORS['failure'],
+        'action_required': STATE_COLORS['failure'],
+        'startup_failure': STATE_COLORS['failure'],
+    })
+
+    WORKFLOW_TYPES = frozenset({'CheckSuite', 'CheckRun'})
+    ISSUE_TYPES = frozenset({'Issue', 'PullRequest'})
+    SKIPPED_CONCLUSIONS = frozenset({'cancelled', 'skipped'})
+    COMMENT_REASONS = frozenset({'comment', 'mention'})
+
+    # Subject API URL patterns -> github.com page, tried in order. Resources without a stable
+    # web URL of their own (e.g. releases, which are addressed by tag on the web) fall back
+    # to the closest page instead of a broken link.
+    _API_REPO = r'^https://api\.github\.com/repos/([^/]+/[^/]+)'
+    API_TO_WEB_URLS = (
+        (re.compile(_API_REPO + r'/pulls/(\d+)$'), r'https://github.com/\1/pull/\2'),
+        (re.compile(_API_REPO + r'/issues/(\d+)$'), r'https://github.com/\1/issues/\2'),
+        (re.compile(_API_REPO + r'/discussions/(\d+)$'), r'https://github.com/\1/discussions/\2'),
+        (re.compile(_API_REPO + r'/commits/([0-9a-f]+)$'), r'https://github.com/\1/commit/\2'),
+        (re.compile(_API_REPO + r'/releases(?:/.*)?$'), r'https://github.com/\1/releases'),
+        (re.compile(_API_REPO + r'(?:/.*)?$'), r'https://github.com/\1'),
+    )
+
+    # Repository and number of an issue/PR subject API URL
+    SUBJECT_NUMBER_RE = re.compile(r'/repos/([^/]+/[^/]+)/(issues|pulls)/(\d+)')
+    # A single issue/PR comment API URL, as in subject.latest_comment_url
+    COMMENT_URL_RE = re.compile(r'/(issues|pulls)/comments/\d+$')
+    # Workflow notification titles, matched case-insensitively
+    WORKFLOW_FAILED_TITLE_RE = re.compile(r'workflow run (failed|failure)|(failed|failure) workflow', re.IGNORECASE)
+    WORKFLOW_SKIPPED_TITLE_RE = re.compile(r'workflow run (cancelled|skipped)|(cancelled|skipped) workflow', re.IGNORECASE)
+
+    GRAPHQL_URL = 'https://api.github.com/graphql'
+    GRAPHQL_BATCH_SIZE = 50  # Issue/PR lookups per GraphQL query
+
+    # Timestamp format accepted for LAST_CHECK_TIME (what the workflow writes, ISO 8601 with offset)
+    ISO8601_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})$')
+
+    NOTIFICATIONS_PER_PAGE = 50  # Maximum page size the notifications API allows
+    MAX_NOTIFICATIONS = 300  # Sent per run; a larger backlog is worked off oldest first over several runs
+    GITHUB_MAX_WORKERS = 8  # Concurrent notifications being enriched via the GitHub API
+    GITHUB_MAX_CONCURRENCY = 8  # In-flight api.github.com requests across all threads
+    DISCORD_MAX_EMBEDS = 10  # Discord allows at most 10 embeds per message
+    DISCORD_MAX_EMBED_CHARS = 6000  # ...and at most 6000 characters across all of them
+    DISCORD_MAX_FIELD_CHARS = 1024  # ...and at most 1024 characters per field value
+    DISCORD_MAX_RETRIES = 5
+    GITHUB_MAX_RATE_LIMIT_WAIT = 60  # seconds
+    GITHUB_RATE_LIMIT_RETRIES = 2  # Retries of a request rejected by a primary/secondary rate limit
+    COMMENTS_PER_PAGE = 100  # Maximum page size of the comment listings
+    COMMENT_TIME_TOLERANCE = 300  # seconds between a comment and the notification it triggered
+
+    # Persisted state (kept between workflow runs via actions/cache)
+    SENT_NOTIFICATIONS_FILE = 'sent_notifications.json'
+    SENT_RETENTION_DAYS = 30
+    SUBJECT_DETAILS_FILE = 'subject_details.json'
+    POLL_STATE_FILE = 'poll_state.json'
+    NOTIFICATIONS_CACHE_FILE = 'notifications_cache.json'
+    DEFAULT_POLL_INTERVAL = 60  # seconds, used when GitHub sends no X-Poll-Interval
+    RATE_LIMIT_LOW_FRACTION = 0.1  # Below this share of the rate limit left...
+    RATE_LIMIT_BACKOFF_FACTOR = 4  # ...stretch the poll interval by this factor
+    DISPATCH_EVENTS = frozenset({'repository_dispatch', 'workflow_dispatch'})  # On-demand workflow triggers
+    # Cached workflow details are trusted for a while; other subjects are always revalidated (ETag)
+    WORKFLOW_CACHE_TTL_IN_PROGRESS = 10 * 60      # 10 minutes
+    WORKFLOW_CACHE_TTL_COMPLETED = 24 * 60 * 60   # 24 hours
+    DETAILS_CACHE_FIELDS = ('state', 'merged', 'draft', 'status', 'conclusion', 'html_url')
 
     def __init__(self):
         self.github_token = os.getenv('PRIVATE_GITHUB_TOKEN')
         self.discord_webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
-        self.last_check_time = os.getenv('LAST_CHECK_TIME')
+        # Validated once here; None (fetch all unread notifications) when unset or malformed
+        self.last_check_time = os.getenv('LAST_CHECK_TIME') or None
+        if self.last_check_time and not self._is_valid_timestamp(self.last_check_time):
+            logger.warning("Invalid LAST_CHECK_TIME format: %s. Fetching all notifications.", self.last_check_time)
+            self.last_check_time = None
+        # Fetch CheckSuite/CheckRun details (status, conclusion, run URL) at the cost of extra API calls
+        self.enrich_check_suites = os.getenv('ENRICH_CHECK_SUITES', '').lower() in ('1', 'true', 'yes')
+        # Optional allow-list of subject types, e.g. "PullRequest,Issue" (empty means all types)
+        self.notify_types = {t.strip() for t in os.getenv('NOTIFY_TYPES', '').split(',')} - {''}
+        # Runs triggered on demand wait out GitHub's (bounded) poll interval instead of being skipped,
+        # so a burst of events isn't left for the next scheduled run
+        self.wait_for_poll_interval = os.getenv('GITHUB_EVENT_NAME') in self.DISPATCH_EVENTS
+        # Comments behind this run's notifications can't predate the last check, so comment
+        # listings only need the tail of long threads
+        self.comments_since = self._comments_since(self.last_check_time)
         
         if not self.github_token:
             raise ValueError("PRIVATE_GITHUB_TOKEN environment variable is required")
@@ -52,476 +156,981 @@ class GitHubNotificationBot:
             'Accept': 'application/vnd.github+json',
             'X-GitHub-Api-Version': '2022-11-28'
         }
-    
-    def get_comment_content(self, notification: Dict) -> Optional[Dict]:
-        """Fetch the actual comment content that triggered the notification"""
-        try:
-            subject = notification.get('subject', {})
-            reason = notification.get('reason', '')
-            
-            # Only fetch comments for relevant notification reasons
-            if reason not in ['comment', 'mention']:
-                return None
+
+        # Keep-alive sessions so TLS connections are reused across requests
+        self.session = self._create_session('https://api.github.com/', self.headers, self.GITHUB_MAX_CONCURRENCY)
+        webhook = urlsplit(self.discord_webhook_url)
+        self.discord_session = self._create_session(f"{webhook.scheme}://{webhook.netloc}/",
+                                                    {'Content-Type': 'application/json'}, 1)
+        # Cap in-flight requests per host: the webhook is a single rate-limit route
+        self._github_semaphore = threading.BoundedSemaphore(self.GITHUB_MAX_CONCURRENCY)
+        self._discord_lock = threading.Lock()
+        self._discord_ready_at = 0.0  # time.monotonic() before which the webhook must not be called
+
+        self.state_dir = os.getenv('STATE_DIR', '.state')
+        # Maps notification id -> updated_at of the version already sent to Discord
+        self.sent_notifications = self._load_state(self.SENT_NOTIFICATIONS_FILE)
+        # REST subject details keyed by API URL: {etag, fetched_at, body}
+        self.subject_details_cache = self._load_state(self.SUBJECT_DETAILS_FILE)
+        # {last_poll_at, poll_interval} from the last successful notifications request
+        self.poll_state = self._load_state(self.POLL_STATE_FILE)
+        # {etag, last_modified} of the last notifications response that was fully processed
+        self.notifications_cache = self._load_state(self.NOTIFICATIONS_CACHE_FILE)
+        self._pending_notifications_cache: Optional[Dict] = None
+        # check_time output of the notifications request, once it is known to be fully handled
+        self._pending_check_time: Optional[str] = None
+        # Subject details fetched during this run, keyed by API URL (futures, see _memoize)
+        self._details_cache: Dict[str, Future] = {}
+        # Normalized comment listings fetched during this run, keyed by API URL
+        self._comments_cache: Dict[str, Future] = {}
+        self._memo_lock = threading.Lock()
+
+    @staticmethod
+    def _create_session(base_url: str, headers: Dict, pool_maxsize: int) -> requests.Session:
+        """Create a pooled HTTP session for one host with the given default headers.
+
+        pool_maxsize should match the session's in-flight request cap: a smaller pool closes
+        connections that concurrent requests opened (new TLS handshakes next time), a larger
+        one just holds idle sockets.
+        """
+        session = requests.Session()
+        session.headers.update(headers)
+        # Transient server errors on idempotent requests are retried with backoff. Rate limits
+        # (429s, Retry-After) are left to the callers, which cap how long they wait:
+        # _github_request for GitHub, _post_to_discord for the webhook (POSTs aren't retried here)
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504],
+                        respect_retry_after_header=False, raise_on_status=False)
+        # Each session talks to a single host, so it needs a single connection pool
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retries)
+        session.mount(base_url, adapter)
+        return session
+
+    def _github_get(self, url: str, **kwargs) -> requests.Response:
+        """GET a GitHub API URL (see _github_request)."""
+        return self._github_request('GET', url, **kwargs)
+
+    def _github_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Call the GitHub API, pausing briefly if a primary or secondary rate limit is hit.
+
+        Requests the rate limit rejected (403/429) are retried after the wait; any other
+        403 is a permission error and is returned as is.
+        """
+        kwargs.setdefault('timeout', 10)
+        for attempt in range(self.GITHUB_RATE_LIMIT_RETRIES + 1):
+            with self._github_semaphore:
+                response = self.session.request(method, url, **kwargs)
             
-            # Get notification timestamp for comparison
-            notification_time_str = notification.get('updated_at')
-            if not notification_time_str:
+            wait = self._rate_limit_wait(response)
+            if wait is None:
+                return response
+            rejected = response.status_code in (403, 429)
+            if wait > self.GITHUB_MAX_RATE_LIMIT_WAIT or (rejected and attempt == self.GITHUB_RATE_LIMIT_RETRIES):
+                # Not worth waiting for, or no retry left to use the wait for
+                logger.warning("GitHub rate limit exhausted, resets in %.0f seconds", wait)
+                return response
+            if wait > 0:
+                logger.warning("GitHub rate limit exhausted, waiting %.0f seconds for reset...", wait)
+                time.sleep(wait)
+            if not rejected:
+                # This request went through; it only used up the limit for the next ones
+                return response
+        return response
+
+    @staticmethod
+    def _rate_limit_wait(response: requests.Response) -> Optional[float]:
+        """Seconds until GitHub's rate limit lets requests through again, or None if not limited."""
+        if response.status_code in (403, 429) and 'Retry-After' in response.headers:
+            # Secondary rate limits say how long to back off
+            try:
+                return max(float(response.headers['Retry-After']), 0.0)
+            except ValueError:
                 return None
-                
-            notification_time = datetime.fromisoformat(notification_time_str.replace('Z', '+00:00'))
-            
-            subject_type = subject.get('type')
-            subject_url = subject.get('url')
-            
-            if not subject_url:
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+            try:
+                return max(int(response.headers['X-RateLimit-Reset']) - time.time(), 0.0)
+            except (KeyError, ValueError):
                 return None
+        return None
+
+    @staticmethod
+    def _json(response: requests.Response):
+        """Decode a response body with orjson (errors are orjson.JSONDecodeError, a ValueError)."""
+        return orjson.loads(response.content)
+
+    def _load_state(self, filename: str) -> Dict:
+        """Load a JSON state file from the state directory, or an empty dict if missing."""
+        path = os.path.join(self.state_dir, filename)
+        try:
+            with open(path, 'rb') as f:
+                data = orjson.loads(f.read())
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read state file %s: %s", path, e)
+            return {}
+
+    def _save_state(self, filename: str, data: Dict):
+        """Atomically write a JSON state file to the state directory."""
+        path = os.path.join(self.state_dir, filename)
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(data))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write state file %s: %s", path, e)
+
+    def select_new_notifications(self, notifications: List[Dict]) -> List[Dict]:
+        """Keep notifications of a wanted type (NOTIFY_TYPES) whose current version wasn't sent yet.
+
+        Both filters run in a single pass so nothing dropped here is ever formatted or enriched.
+        Of more than MAX_NOTIFICATIONS new ones only the oldest are kept, and the notifications
+        response isn't marked as handled: the next run fetches it again and, with these recorded
+        as sent, continues with the rest.
+        """
+        sent = self.sent_notifications
+        types = self.notify_types
+        new_notifications = [
+            n for n in notifications
+            if sent.get(n['id']) != n['updated_at']
+            and (not types or n.get('subject', {}).get('type') in types)
+        ]
+        skipped = len(notifications) - len(new_notifications)
+        if skipped:
+            logger.info("Skipping %s notification(s) already sent to Discord or not in NOTIFY_TYPES", skipped)
+        
+        if len(new_notifications) > self.MAX_NOTIFICATIONS:
+            logger.warning("%s new notifications; sending the oldest %s now and the rest on the next run(s)",
+                           len(new_notifications), self.MAX_NOTIFICATIONS)
+            new_notifications.sort(key=lambda n: n['updated_at'])
+            del new_notifications[self.MAX_NOTIFICATIONS:]
+            self._pending_notifications_cache = None
+            self._pending_check_time = None
+        return new_notifications
+
+    def record_sent(self, notifications: List[Dict]):
+        """Remember notifications as sent (in memory; see save_sent_notifications)."""
+        for n in notifications:
+            self.sent_notifications[n['id']] = n['updated_at']
+
+    def save_sent_notifications(self):
+        """Prune sent entries older than the retention window and persist the rest."""
+        cutoff = time.time() - self.SENT_RETENTION_DAYS * 86400
+        for notification_id, updated_at in list(self.sent_notifications.items()):
+            try:
+                updated = parse_github_timestamp(updated_at)
+            except (ValueError, AttributeError):
+                updated = 0
+            if updated < cutoff:
+                del self.sent_notifications[notification_id]
+
+        self._save_state(self.SENT_NOTIFICATIONS_FILE, self.sent_notifications)
+    
+    def _comment_listings(self, notification: Dict) -> List[Tuple[str, str]]:
+        """Comment URLs (with their comment type) that may hold the comment behind a notification.
+
+        Usually that is the single comment the notification already links to; the full listings
+        of an issue/PR are only needed when it doesn't.
+        """
+        subject = notification.get('subject', {})
+        subject_type = subject.get('type')
+        
+        # Only issues and PRs have comments we can match, and only for relevant notification reasons
+        if subject_type not in self.ISSUE_TYPES or notification.get('reason') not in self.COMMENT_REASONS:
+            return []
+        
+        subject_url = subject.get('url')
+        
+        if not subject_url:
+            return []
+        
+        # latest_comment_url equals the subject URL when the activity wasn't a comment
+        latest_comment_url = subject.get('latest_comment_url')
+        if latest_comment_url and latest_comment_url != subject_url:
+            comment_match = self.COMMENT_URL_RE.search(latest_comment_url)
+            if comment_match:
+                comment_type = 'review_comment' if comment_match.group(1) == 'pulls' else 'issue_comment'
+                return [(latest_comment_url, comment_type)]
+        
+        # Extract repository and issue/PR number from the URL in one match
+        match = self.SUBJECT_NUMBER_RE.search(subject_url)
+        if not match:
+            return []
+        repo_name, kind, number = match.groups()
+        
+        if subject_type == 'Issue' and kind == 'issues':
+            return [(f"https://api.github.com/repos/{repo_name}/issues/{number}/comments", 'issue_comment')]
+        if subject_type == 'PullRequest' and kind == 'pulls':
+            # Both issue comments and review comments for PRs
+            return [
+                (f"https://api.github.com/repos/{repo_name}/issues/{number}/comments", 'issue_comment'),
+                (f"https://api.github.com/repos/{repo_name}/pulls/{number}/comments", 'review_comment'),
+            ]
+        return []
+
+    def _fetch_comment_listing(self, url: str, comment_type: str) -> List[Dict]:
+        """Fetch one comment listing, or an empty list (with a warning) if it can't be fetched."""
+        try:
+            return self._get_comments(url, comment_type)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.warning("    Could not fetch %ss: %s", comment_type.replace('_', ' '), e)
+            return []
+
+    def get_comment_content(self, comments: List[Dict], notification_ts: float) -> Optional[Dict]:
+        """Pick the comment that triggered a notification (updated at notification_ts) from its comment listings"""
+        matching_comment = self._find_matching_comment(comments, notification_ts)
+        comment_content = matching_comment['body'] if matching_comment else None
+        
+        if comment_content:
+            # Truncate long comments for Discord embed limits
+            max_length = 1000  # Leave room for other embed content
+            if len(comment_content) > max_length:
+                comment_content = comment_content[:max_length-3] + "..."
             
-            comment_content = None
-            comment_author = None
-            comment_url = None
-            matching_comment = None
-            
-            if subject_type == 'Issue':
-                # Extract issue number from URL
-                import re
-                issue_match = re.search(r'/issues/(\d+)', subject_url)
-                if issue_match:
-                    issue_number = issue_match.group(1)
-                    repo_match = re.search(r'/repos/([^/]+/[^/]+)/', subject_url)
-                    if repo_match:
-                        repo_name = repo_match.group(1)
-                        comments_url = f"https://api.github.com/repos/{repo_name}/issues/{issue_number}/comments"
-                        
-                        print(f"    Fetching issue comments from: {comments_url}")
-                        response = requests.get(comments_url, headers=self.headers, timeout=10)
-                        response.raise_for_status()
-                        comments = response.json()
-                        
-                        if comments:
-                            # Find comment closest to notification time
-                            time_tolerance_seconds = 300  # 5 minutes
-                            
-                            for comment in reversed(comments):  # Start from newest
-                                comment_time = datetime.fromisoformat(comment['created_at'].replace('Z', '+00:00'))
-                                time_diff = abs((notification_time - comment_time).total_seconds())
-                                
-                                if time_diff <= time_tolerance_seconds:
-                                    matching_comment = comment
-                                    break
-                            
-                            # If no exact match, use the most recent comment before notification
-                            if not matching_comment:
-                                for comment in reversed(comments):
-                                    comment_time = datetime.fromisoformat(comment['created_at'].replace('Z', '+00:00'))
-                                    if comment_time <= notification_time:
-                                        matching_comment = comment
-                                        break
-                            
-                            # Fallback to latest comment
-                            if not matching_comment and comments:
-                                matching_comment = comments[-1]
-                            
-                            if matching_comment:
-                                comment_content = matching_comment.get('body', '')
-                                comment_author = matching_comment.get('user', {}).get('login', 'Unknown')
-                                comment_url = matching_comment.get('html_url', '')
-                        
-            elif subject_type == 'PullRequest':
-                # Extract PR number from URL
-                pr_match = re.search(r'/pulls/(\d+)', subject_url)
-                if pr_match:
-                    pr_number = pr_match.group(1)
-                    repo_match = re.search(r'/repos/([^/]+/[^/]+)/', subject_url)
-                    if repo_match:
-                        repo_name = repo_match.group(1)
-                        
-                        # Get both issue comments and review comments for PRs
-                        issue_comments_url = f"https://api.github.com/repos/{repo_name}/issues/{pr_number}/comments"
-                        review_comments_url = f"https://api.github.com/repos/{repo_name}/pulls/{pr_number}/comments"
-                        
-                        all_comments = []
-                        
-                        # Fetch issue comments
-                        try:
-                            print(f"    Fetching PR issue comments from: {issue_comments_url}")
-                            response = requests.get(issue_comments_url, headers=self.headers, timeout=10)
-                            response.raise_for_status()
-                            issue_comments = response.json()
-                            
-                            for comment in issue_comments:
-                                comment_time = datetime.fromisoformat(comment['created_at'].replace('Z', '+00:00'))
-                                all_comments.append({
-                                    'created_at': comment_time,
-                                    'body': comment.get('body', ''),
-                                    'author': comment.get('user', {}).get('login', 'Unknown'),
-                                    'url': comment.get('html_url', ''),
-                                    'type': 'issue_comment'
-                                })
-                        except requests.exceptions.RequestException as e:
-                            print(f"    Could not fetch issue comments: {e}")
-                        
-                        # Fetch review comments
-                        try:
-                            print(f"    Fetching PR review comments from: {review_comments_url}")
-                            response = requests.get(review_comments_url, headers=self.headers, timeout=10)
-                            response.raise_for_status()
-                            review_comments = response.json()
-                            
-                            for comment in review_comments:
-                                comment_time = datetime.fromisoformat(comment['created_at'].replace('Z', '+00:00'))
-                                all_comments.append({
-                                    'created_at': comment_time,
-                                    'body': comment.get('body', ''),
-                                    'author': comment.get('user', {}).get('login', 'Unknown'),
-                                    'url': comment.get('html_url', ''),
-                                    'type': 'review_comment'
-                                })
-                        except requests.exceptions.RequestException as e:
-                            print(f"    Could not fetch review comments: {e}")
-                        
-                        if all_comments:
-                            # Sort by creation time (newest first)
-                            all_comments.sort(key=lambda x: x['created_at'], reverse=True)
-                            
-                            # Find comment that matches the notification time
-                            time_tolerance_seconds = 300  # 5 minutes
-                            
-                            for comment_data in all_comments:
-                                time_diff = abs((notification_time - comment_data['created_at']).total_seconds())
-                                if time_diff <= time_tolerance_seconds:
-                                    matching_comment = comment_data
-                                    break
-                            
-                            # If no exact match, use the most recent comment before notification
-                            if not matching_comment:
-                                for comment_data in all_comments:
-                                    if comment_data['created_at'] <= notification_time:
-                                        matching_comment = comment_data
-                                        break
-                            
-                            # Fallback to latest comment
-                            if not matching_comment and all_comments:
-                                matching_comment = all_comments[0]
-                            
-                            if matching_comment:
-                                comment_content = matching_comment['body']
-                                comment_author = matching_comment['author']
-                                comment_url = matching_comment['url']
-            
-            if comment_content:
-                # Truncate long comments for Discord embed limits
-                max_length = 1000  # Leave room for other embed content
-                if len(comment_content) > max_length:
-                    comment_content = comment_content[:max_length-3] + "..."
-                
-                return {
-                    'content': comment_content,
-                    'author': comment_author,
-                    'url': comment_url
-                }
-                
-        except Exception as e:
-            print(f"    Could not fetch comment content for notification: {e}")
+            return {
+                'content': comment_content,
+                'author': matching_comment['author'],
+                'url': matching_comment['url']
+            }
             
         return None
 
-    def _get_subject_details(self, url: str) -> Optional[Dict]:
-        """Helper to fetch details for a PR or Issue from its API URL."""
+    @classmethod
+    def _is_valid_timestamp(cls, value: str) -> bool:
+        """Whether value is an ISO 8601 timestamp with offset that names a real point in time."""
+        if not cls.ISO8601_RE.match(value):
+            return False
+        try:
+            # Catches impossible dates and times the pattern lets through (e.g. 2026-02-30T25:61:00Z)
+            parse_github_timestamp(value)
+        except ValueError:
+            return False
+        return True
+
+    def _comments_since(self, last_check_time: Optional[str]) -> Optional[str]:
+        """Lower bound for comment listings: the last check minus the matching tolerance."""
+        try:
+            since = parse_github_timestamp(last_check_time) - self.COMMENT_TIME_TOLERANCE
+        except (ValueError, TypeError):
+            return None
+        return datetime.fromtimestamp(since, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def _get_comments(self, url: str, comment_type: str) -> List[Dict]:
+        """Fetch and normalize a comments listing (or a single comment), memoized per URL for the run.
+
+        Several notifications on the same issue or PR then share a single request. Only
+        comments updated since the last check are listed, so long threads stay one small page.
+        """
+        def fetch():
+            logger.debug("    Fetching %ss from: %s", comment_type.replace('_', ' '), url)
+            params = {}
+            if not self.COMMENT_URL_RE.search(url):
+                params['per_page'] = self.COMMENTS_PER_PAGE
+                if self.comments_since:
+                    params['since'] = self.comments_since
+                if comment_type == 'review_comment':
+                    # Review comments can be listed newest first (issue comments are always oldest
+                    # first), so the first page holds the match even without a 'since' bound
+                    params.update(sort='created', direction='desc')
+            response = self._github_get(url, params=params)
+            response.raise_for_status()
+            data = self._json(response)
+            return self._normalize_comments([data] if isinstance(data, dict) else data, comment_type)
+        return self._memoize(self._comments_cache, url, fetch)
+
+    def _memoize(self, cache: Dict[str, Future], key: str, fetch):
+        """Return fetch() for key, computed once per run even when several threads ask concurrently.
+
+        The first caller fetches; the others wait on its result (or its exception) instead of
+        sending the same request again.
+        """
+        with self._memo_lock:
+            future = cache.get(key)
+            owner = future is None
+            if owner:
+                future = cache[key] = Future()
+        if owner:
+            try:
+                future.set_result(fetch())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    @staticmethod
+    def _normalize_comments(comments: List[Dict], comment_type: str) -> List[Dict]:
+        """Reduce raw API comments to the fields we use, with created_at as epoch seconds."""
+        return [{
+            'created_at': parse_github_timestamp(comment['created_at']),
+            'body': comment.get('body', ''),
+            'author': comment.get('user', {}).get('login', 'Unknown'),
+            'url': comment.get('html_url', ''),
+            'type': comment_type
+        } for comment in comments]
+
+    @staticmethod
+    def _find_matching_comment(comments: List[Dict], notification_ts: float,
+                               time_tolerance_seconds: int = COMMENT_TIME_TOLERANCE) -> Optional[Dict]:
+        """Pick the comment that most likely triggered the notification.
+
+        Prefers the newest comment within the tolerance window, then the most recent
+        comment before the notification, then the latest comment overall.
+        """
+        if not comments:
+            return None
+        comments.sort(key=lambda c: c['created_at'])
+        times = [c['created_at'] for c in comments]
+        
+        # Newest comment created no later than the end of the tolerance window. If it is
+        # outside the window it is also the most recent comment before the notification.
+        index = bisect.bisect_right(times, notification_ts + time_tolerance_seconds) - 1
+        if index >= 0:
+            return comments[index]
+        
+        # Fallback to latest comment
+        return comments[-1]
+
+    def _get_subject_details(self, url: str, updated_ts: Optional[float] = None) -> Optional[Dict]:
+        """Helper to fetch details for a PR or Issue from its API URL.
+
+        Results are memoized for the rest of the run. The fields the formatter uses are also
+        persisted, so a later run can revalidate them with a 304 instead of a full download.
+        updated_ts is the epoch of the notification asking, see _fetch_subject_details.
+        """
         if not url:
             return None
+        return self._memoize(self._details_cache, url, lambda: self._fetch_subject_details(url, updated_ts))
+
+    def _fetch_subject_details(self, url: str, updated_ts: Optional[float] = None) -> Optional[Dict]:
+        """Fetch subject details through the persisted cache (TTL for workflows, ETag for all).
+
+        A cached entry older than the notification's updated_ts is never served from the TTL:
+        the subject changed since, e.g. an in-progress check suite completed.
+        """
+        headers = {}
+        cached = self.subject_details_cache.get(url)
+        if cached:
+            body = cached.get('body', {})
+            if 'status' not in body:
+                ttl = 0
+            elif body['status'] == 'completed':
+                ttl = self.WORKFLOW_CACHE_TTL_COMPLETED
+            else:
+                ttl = self.WORKFLOW_CACHE_TTL_IN_PROGRESS
+            fetched_at = cached.get('fetched_at', 0)
+            if time.time() - fetched_at < ttl and (updated_ts is None or updated_ts <= fetched_at):
+                logger.debug("    Using cached details for: %s", url)
+                return body
+            if cached.get('etag'):
+                headers = {'If-None-Match': cached['etag']}
+
+        try:
+            logger.debug("    Fetching details from: %s", url)
+            response = self._github_get(url, headers=headers)
+            if response.status_code == 304 and cached:
+                logger.debug("    Details not modified since last run: %s", url)
+                details = cached['body']
+            else:
+                response.raise_for_status()
+                details = self._json(response)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.warning("    Could not fetch details for %s. Error: %s", url, e)
+            return None
+
+        self.subject_details_cache[url] = {
+            'etag': response.headers.get('ETag') or (cached or {}).get('etag'),
+            'fetched_at': time.time(),
+            'body': {key: details[key] for key in self.DETAILS_CACHE_FIELDS if key in details}
+        }
+        return details
+
+    def _prefetch_subject_details(self, executor: ThreadPoolExecutor, notifications: List[Dict]):
+        """Look up the state of all issue/PR subjects with one GraphQL query per batch.
+
+        A future per subject URL is registered in the details memo right away, so
+        _get_subject_details and _start_lookups pick up the batched result instead of
+        sending one REST request per notification.
+        """
+        subjects = {}
+        for n in notifications:
+            subject = n.get('subject', {})
+            url = subject.get('url')
+            if subject.get('type') not in self.ISSUE_TYPES or not url:
+                continue
+            match = self.SUBJECT_NUMBER_RE.search(url)
+            if match:
+                subjects[url] = match.groups()
+        
+        pending = {}
+        with self._memo_lock:
+            for url in subjects:
+                if url not in self._details_cache:
+                    pending[url] = self._details_cache[url] = Future()
+        
+        urls = list(pending)
+        for start in range(0, len(urls), self.GRAPHQL_BATCH_SIZE):
+            batch = {url: subjects[url] for url in urls[start:start + self.GRAPHQL_BATCH_SIZE]}
+            executor.submit(self._fetch_subject_states, batch, pending)
+
+    def _fetch_subject_states(self, subjects: Dict[str, Tuple[str, str, str]], futures: Dict[str, Future]):
+        """Resolve the detail futures of a batch of issue/PR subjects (see _query_subject_states)."""
         try:
-            print(f"    Fetching details from: {url}")
-            response = requests.get(url, headers=self.headers, timeout=10)
+            results = self._query_subject_states(subjects)
+        except BaseException as e:
+            for url in subjects:
+                futures[url].set_exception(e)
+            raise
+        for url in subjects:
+            futures[url].set_result(results.get(url))
+
+    def _query_subject_states(self, subjects: Dict[str, Tuple[str, str, str]]) -> Dict[str, Optional[Dict]]:
+        """Fetch the state of a batch of issue/PR subjects with a single GraphQL query.
+
+        Results carry the REST field names the formatter reads (state, merged, draft). If the
+        query itself fails, each subject falls back to its REST lookup.
+        """
+        # One repository selection per repo, holding an aliased issueOrPullRequest per subject
+        repos: Dict[str, List[Tuple[int, str]]] = {}
+        for i, (repo_name, _, number) in enumerate(subjects.values()):
+            repos.setdefault(repo_name, []).append((i, number))
+        
+        variables = {}
+        params = []
+        selections = []
+        repo_aliases = {}
+        for r, (repo_name, items) in enumerate(repos.items()):
+            owner, name = repo_name.split('/', 1)
+            variables.update({f'o{r}': owner, f'n{r}': name})
+            params.append(f'$o{r}: String!, $n{r}: String!')
+            lookups = ' '.join(
+                f's{i}: issueOrPullRequest(number: {int(number)}) {{ '
+                f'... on Issue {{ state }} ... on PullRequest {{ state merged isDraft }} }}'
+                for i, number in items
+            )
+            selections.append(f'r{r}: repository(owner: $o{r}, name: $n{r}) {{ {lookups} }}')
+            repo_aliases.update({i: f'r{r}' for i, _ in items})
+        query = f"query({', '.join(params)}) {{ {' '.join(selections)} }}"
+        
+        try:
+            logger.debug("    Fetching state of %s issues/PRs via GraphQL", len(subjects))
+            response = self._github_request('POST', self.GRAPHQL_URL,
+                                            data=orjson.dumps({'query': query, 'variables': variables}),
+                                            headers={'Content-Type': 'application/json'})
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"    Could not fetch details for {url}. Error: {e}")
+            data = self._json(response).get('data')
+            if data is None:
+                raise ValueError("GraphQL response has no data")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("    GraphQL lookup failed (%s); fetching details one by one", e)
+            return {url: self._fetch_subject_details(url) for url in subjects}
+        
+        results = {}
+        for i, url in enumerate(subjects):
+            # Missing (deleted or inaccessible) subjects come back as null, like a REST 404
+            node = (data.get(repo_aliases[i]) or {}).get(f's{i}')
+            if not node:
+                continue
+            # GraphQL reports merged PRs as state MERGED; REST says closed + merged
+            state = node['state'].lower()
+            results[url] = {'state': 'closed' if state == 'merged' else state}
+            if 'merged' in node:
+                results[url].update(merged=node['merged'], draft=node['isDraft'])
+        return results
+
+    def save_subject_details_cache(self):
+        """Persist the subject details cache, dropping entries past the longest TTL."""
+        cutoff = time.time() - self.WORKFLOW_CACHE_TTL_COMPLETED
+        self.subject_details_cache = {
+            url: entry for url, entry in self.subject_details_cache.items()
+            if entry.get('fetched_at', 0) >= cutoff
+        }
+        self._save_state(self.SUBJECT_DETAILS_FILE, self.subject_details_cache)
+
+    def _to_web_url(self, api_url: str) -> str:
+        """Convert a subject API URL to the matching github.com page."""
+        for pattern, template in self.API_TO_WEB_URLS:
+            match = pattern.match(api_url)
+            if match:
+                return match.expand(template)
+        return api_url
+
+    def _record_poll(self, response: requests.Response):
+        """Persist when we polled and how long to wait: X-Poll-Interval, stretched when quota is low."""
+        try:
+            poll_interval = int(response.headers.get('X-Poll-Interval', self.DEFAULT_POLL_INTERVAL))
+        except ValueError:
+            poll_interval = self.DEFAULT_POLL_INTERVAL
+        
+        # Back off harder as the primary rate limit runs low
+        try:
+            remaining = int(response.headers['X-RateLimit-Remaining'])
+            limit = int(response.headers['X-RateLimit-Limit'])
+        except (KeyError, ValueError):
+            remaining = limit = 0
+        if limit and remaining / limit < self.RATE_LIMIT_LOW_FRACTION:
+            poll_interval *= self.RATE_LIMIT_BACKOFF_FACTOR
+            logger.warning("GitHub rate limit low (%s/%s remaining); polling at most every %s seconds",
+                           remaining, limit, poll_interval)
+        
+        self.poll_state = {'last_poll_at': time.time(), 'poll_interval': poll_interval}
+        self._save_state(self.POLL_STATE_FILE, self.poll_state)
+        # Lets the workflow (or any wrapper scheduling the bot) honor the interval as well
+        self._set_output('poll_interval', str(poll_interval))
+
+    @staticmethod
+    def _check_time(date_header: Optional[str]) -> Optional[str]:
+        """GitHub's time of the notifications request (its Date header) in LAST_CHECK_TIME's format.
+
+        The next run's 'since' comes from GitHub's clock at the time of this request, not the
+        runner's clock after sending: no drift, and nothing updated mid-run is skipped.
+        """
+        try:
+            checked_at = parsedate_to_datetime(date_header).astimezone(timezone.utc)
+        except (TypeError, ValueError):
+            logger.warning("No usable Date header on the notifications response; keeping LAST_CHECK_TIME")
             return None
+        return checked_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def poll_wait_remaining(self) -> float:
+        """Seconds until GitHub's poll interval allows the next notifications request (0 if allowed now)."""
+        elapsed = time.time() - self.poll_state.get('last_poll_at', 0)
+        return max(0.0, self.poll_state.get('poll_interval', 0) - elapsed)
 
-    def get_notifications(self) -> List[Dict]:
-        """Fetch GitHub notifications"""
-        print("\n" + "="*50)
-        print("STEP 1: FETCHING GITHUB NOTIFICATIONS")
-        print("="*50)
+    @staticmethod
+    def _set_output(name: str, value: str):
+        """Expose a step output when running inside GitHub Actions."""
+        output_path = os.getenv('GITHUB_OUTPUT')
+        if output_path:
+            with open(output_path, 'a', encoding='utf-8') as f:
+                f.write(f"{name}={value}\n")
+
+    def get_notifications(self) -> Optional[List[Dict]]:
+        """Fetch GitHub notifications (None if any page failed to load)"""
+        logger.info("\n" + "="*50)
+        logger.info("STEP 1: FETCHING GITHUB NOTIFICATIONS")
+        logger.info("="*50)
         
         url = 'https://api.github.com/notifications'
         params = {
             'all': 'false',
-            'participating': 'false'
+            'participating': 'false',
+            'per_page': self.NOTIFICATIONS_PER_PAGE
         }
         if self.last_check_time:
-            try:
-                datetime.fromisoformat(self.last_check_time.replace('Z', '+00:00'))
-                params['since'] = self.last_check_time
-                print(f"Using 'since' parameter: {self.last_check_time}")
-            except (ValueError, AttributeError):
-                print(f"Invalid LAST_CHECK_TIME format: {self.last_check_time}. Fetching all notifications.")
+            params['since'] = self.last_check_time
+            logger.info("Using 'since' parameter: %s", self.last_check_time)
         else:
-            print("No last check time found - fetching all unread notifications")
+            logger.info("No last check time found - fetching all unread notifications")
         
+        # Conditional request: GitHub answers 304 (not counted against the rate limit) when nothing changed.
+        # Last-Modified holds for any query; an ETag only matches the exact same 'since' it was issued for.
+        headers = {}
+        if self.notifications_cache.get('last_modified'):
+            headers['If-Modified-Since'] = self.notifications_cache['last_modified']
+        if self.notifications_cache.get('etag') and self.notifications_cache.get('since') == params.get('since'):
+            headers['If-None-Match'] = self.notifications_cache['etag']
+        
+        notifications = []
         try:
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self._github_get(url, params=params, headers=headers)
+            if response.status_code == 304:
+                self._record_poll(response)
+                self._pending_check_time = self._check_time(response.headers.get('Date'))
+                logger.info("Notifications not modified since last check (304)")
+                return []
             response.raise_for_status()
-            notifications = response.json()
-            print(f"Total notifications received: {len(notifications)}")
-            return notifications
+            notifications.extend(self._json(response))
+            self._record_poll(response)
+            date_header = response.headers.get('Date')
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'since': params.get('since')
+            }
             
-        except requests.exceptions.RequestException as e:
-            print(f"API REQUEST FAILED: {e}")
-            return []
+            # Follow the Link header through all remaining pages: they come newest first, so the
+            # oldest notifications (sent first when there are too many) are on the last ones
+            next_url = response.links.get('next', {}).get('url')
+            while next_url:
+                logger.info("Fetching next page of notifications: %s", next_url)
+                response = self._github_get(next_url)
+                response.raise_for_status()
+                notifications.extend(self._json(response))
+                next_url = response.links.get('next', {}).get('url')
+            
+            # Only reuse these validators (and move LAST_CHECK_TIME) once every fetched
+            # notification has been handled; see select_new_notifications and run
+            self._pending_notifications_cache = validators
+            self._pending_check_time = self._check_time(date_header)
+            
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.error("API REQUEST FAILED: %s", e)
+            # A partial list would look like a complete one to the caller; make it retry instead
+            return None
+        
+        logger.info("Total notifications received: %s", len(notifications))
+        return notifications
+
+    def save_notifications_cache(self):
+        """Persist the validators of the last fully processed notifications response and expose its check_time."""
+        if self._pending_notifications_cache:
+            self.notifications_cache = self._pending_notifications_cache
+            self._save_state(self.NOTIFICATIONS_CACHE_FILE, self.notifications_cache)
+        if self._pending_check_time:
+            self._set_output('check_time', self._pending_check_time)
 
-    def format_notification_for_discord(self, notification: Dict) -> Dict:
-        """Format a GitHub notification for a rich Discord embed."""
+    def _is_skipped_workflow(self, subject: Dict) -> bool:
+        """Whether a workflow notification's title says the run was cancelled or skipped."""
+        return bool(self.WORKFLOW_SKIPPED_TITLE_RE.search(subject.get('title', '')))
+
+    def _wants_details(self, subject: Dict) -> bool:
+        """Whether formatting this subject needs its details fetched from the API."""
+        if not subject.get('url'):
+            return False
+        if subject.get('type') in self.WORKFLOW_TYPES:
+            # Title-based handling is enough for the common case; skip the extra API call.
+            # Notification subjects carry no node_id, so a GraphQL lookup can't replace this one.
+            return self.enrich_check_suites and not self._is_skipped_workflow(subject)
+        # Releases, commits etc. have no 'state', so their details would only ever show "Unknown".
+        # Discussion state isn't exposed by the subject's REST URL either; it would need GraphQL.
+        return subject.get('type') in self.ISSUE_TYPES
+
+    def _start_lookups(self, executor: ThreadPoolExecutor,
+                       notification: Dict) -> Tuple[Optional[Future], List[Future]]:
+        """Submit the detail and comment lookups a notification needs (None / empty when not needed).
+
+        Each comment listing is its own task, so a PR's issue and review comments load in parallel.
+        """
+        subject = notification.get('subject', {})
+        details_future = None
+        if self._wants_details(subject):
+            # Batched GraphQL lookups (see _prefetch_subject_details) are already in the memo
+            updated_ts = parse_github_timestamp(notification['updated_at']) if notification.get('updated_at') else None
+            details_future = (self._details_cache.get(subject['url'])
+                              or executor.submit(self._get_subject_details, subject['url'], updated_ts))
+        comment_futures = [executor.submit(self._fetch_comment_listing, url, comment_type)
+                           for url, comment_type in self._comment_listings(notification)]
+        return details_future, comment_futures
+
+    def _subject_status(self, subject_type: str, details: Dict, default_color: int) -> Tuple[str, int]:
+        """Status field text and embed color of a PR, issue or other subject with a state."""
+        state = (details.get('state') or 'unknown').lower()
+        if subject_type == 'PullRequest' and details.get('merged'):
+            return "Merged", self.STATE_COLORS['merged']
+        if subject_type in ('PullRequest', 'Issue') and state in ('open', 'closed'):
+            status_value = state.title()
+            if subject_type == 'PullRequest' and details.get('draft') and state == 'open':
+                # Keep the open color but could add a draft-specific color if desired
+                status_value += " (Draft)"
+            return status_value, self.STATE_COLORS[state]
+        # Any other state - keep the base type color
+        return state.title(), default_color
+
+    def format_notification_for_discord(self, notification: Dict, details: Optional[Dict] = None,
+                                        comment_data: Optional[Dict] = None,
+                                        updated_ts: Optional[float] = None) -> Dict:
+        """Format a GitHub notification for a rich Discord embed from already-fetched details/comment."""
         subject = notification.get('subject', {})
         repo = notification.get('repository', {})
         subject_type = subject.get('type', 'Unknown')
 
         # Default status and color, which can be overridden by specific logic below
         status_value = "Unknown"
-        embed_color = self.TYPE_COLORS.get(subject_type, 0x6b7280)  # Default to gray if type is new
+        embed_color = self.TYPE_COLORS.get(subject_type, self.DEFAULT_COLOR)
 
         # Determine if it's a workflow notification and check for immediate skipping conditions
-        is_workflow_notification = subject_type in ['CheckSuite', 'CheckRun']
-        title_lower = subject.get('title', '').lower().strip() # Add .strip()
+        is_workflow_notification = subject_type in self.WORKFLOW_TYPES
 
         if is_workflow_notification:
-            # Use regex for more robust matching of cancellation/skipped phrases in title
-            # This handles variations in spacing or other subtle differences
-            if re.search(r'workflow run (cancelled|skipped)|(cancelled|skipped) workflow', title_lower):
-                print(f"    Skipping workflow due to title match: {subject.get('title', 'No title')}")
+            if self._is_skipped_workflow(subject):
+                logger.info("    Skipping workflow due to title match: %s", subject.get('title', 'No title'))
                 return None
             # Check for workflow failure title using regex
-            if re.search(r'workflow run (failed|failure)|(failed|failure) workflow', title_lower):
+            if self.WORKFLOW_FAILED_TITLE_RE.search(subject.get('title', '')):
                 embed_color = self.STATE_COLORS['failure']
-
-        details = self._get_subject_details(subject.get('url'))
-        
-        if details:
-            state = details.get('state', 'unknown').lower()
             
-            if is_workflow_notification:
+            if details:
                 # Check for status/conclusion in details for CheckSuite/CheckRun
-                status_value = details.get('status')
+                status = details.get('status')
                 conclusion = details.get('conclusion')
-
-                if status_value == 'completed':
-                    if conclusion in ['cancelled', 'skipped']:
-                        print(f"    Skipping workflow due to status/conclusion: {subject.get('title', 'No title')} (Status: {status_value}, Conclusion: {conclusion})")
+                if status == 'completed':
+                    if conclusion in self.SKIPPED_CONCLUSIONS:
+                        logger.info("    Skipping workflow due to status/conclusion: %s (Status: %s, Conclusion: %s)",
+                                    subject.get('title', 'No title'), status, conclusion)
                         return None
+                    embed_color = self.CONCLUSION_COLORS.get(conclusion, embed_color)
+                status_value = status or status_value
 
-            elif subject_type == 'PullRequest':
-                if details.get('merged'):
-                    status_value = "Merged"
-                    embed_color = self.STATE_COLORS['merged']
-                elif state == 'open':
-                    status_value = "Open"
-                    embed_color = self.STATE_COLORS['open']
-                elif state == 'closed':
-                    status_value = "Closed"
-                    embed_color = self.STATE_COLORS['closed']
-                else:
-                    status_value = state.title()
-                
-                if details.get('draft') and state == 'open':
-                    status_value += " (Draft)"
-                    # Keep the open color but could add a draft-specific color if desired
-
-            elif subject_type == 'Issue':
-                if state == 'open':
-                    status_value = "Open"
-                    embed_color = self.STATE_COLORS['open']
-                elif state == 'closed':
-                    status_value = "Closed"
-                    embed_color = self.STATE_COLORS['closed']
-                else:
-                    status_value = state.title()
-            
-            else: # For Release, Discussion, etc. - use base type colors
-                status_value = state.title()
-                # Keep the base type color for these
+        elif details:
+            status_value, embed_color = self._subject_status(subject_type, details, embed_color)
+        elif subject_type not in self.ISSUE_TYPES:
+            # Never looked up (see _wants_details), so there is no state to report
+            status_value = "—"
         
-        # Basic embed structure with dynamic color
+        # Convert API URL to a user-friendly web URL
+        web_url = None
+        if is_workflow_notification:
+            # Check suite API URLs have no web page; use the run's page if known, else the Actions tab
+            if details and details.get('html_url'):
+                web_url = details['html_url']
+            elif repo.get('html_url'):
+                web_url = f"{repo['html_url']}/actions"
+        elif subject.get('url'):
+            web_url = self._to_web_url(subject['url'])
+
+        # Last Activity Time (relative), unless the caller already parsed it
+        if updated_ts is None and notification.get('updated_at'):
+            updated_ts = parse_github_timestamp(notification['updated_at'])
+
+        # Fields: Type, Repository, Reason, Last Activity, Status (determined above during color
+        # selection) and the latest comment, the optional ones only when available
+        fields = [
+            {"name": "Type", "value": subject_type, "inline": True},
+            {"name": "Repository", "value": f"[{repo.get('full_name', 'Unknown')}]({repo.get('html_url', '#')})", "inline": True},
+            {"name": "Reason", "value": notification.get('reason', 'unknown'), "inline": True},
+            *([{"name": "Last Activity", "value": f"<t:{int(updated_ts)}:R>", "inline": True}]
+              if updated_ts is not None else []),
+            {"name": "Status", "value": status_value, "inline": True},
+            *([self._comment_field(comment_data)] if comment_data else []),
+        ]
+
+        # Build the embed in one go; thumbnail is the repo owner's avatar
+        avatar_url = repo.get('owner', {}).get('avatar_url')
         embed = {
             "title": subject.get('title', 'No title'),
             "color": embed_color,
             "timestamp": notification.get('updated_at'),
-            "fields": []
+            **({"thumbnail": {"url": avatar_url}} if avatar_url else {}),
+            **({"url": web_url} if web_url else {}),
+            "fields": fields,
+        }
+
+        return embed
+
+    def _comment_field(self, comment_data: Dict) -> Dict:
+        """Embed field quoting a comment, its text shortened so the whole value fits Discord's field limit."""
+        opening = "```\n"
+        closing = f"\n```\n[View Comment]({comment_data['url']})"
+        content = comment_data['content']
+        room = max(self.DISCORD_MAX_FIELD_CHARS - len(opening) - len(closing), 3)
+        if len(content) > room:
+            content = content[:room - 3] + "..."
+        return {
+            "name": f"💬 Latest Comment by @{comment_data['author']}",
+            "value": f"{opening}{content}{closing}",
+            "inline": False
         }
 
-        # Set thumbnail to repo owner's avatar
-        if repo.get('owner', {}).get('avatar_url'):
-            embed["thumbnail"] = {"url": repo['owner']['avatar_url']}
+    @staticmethod
+    def _embed_length(embed: Dict) -> int:
+        """Characters of an embed that count towards Discord's per-message limit."""
+        return (len(embed.get('title', '')) + len(embed.get('description', ''))
+                + sum(len(field['name']) + len(field['value']) for field in embed.get('fields', [])))
 
-        # Convert API URL to a user-friendly web URL
-        if subject.get('url'):
-            api_url = subject['url']
-            web_url = api_url.replace('api.github.com/repos', 'github.com')
-            if '/pulls/' in web_url:
-                web_url = web_url.replace('/pulls/', '/pull/')
-            # No change needed for /issues/
-            embed["url"] = web_url
-
-        # Field: Type
-        embed["fields"].append({
-            "name": "Type",
-            "value": subject_type,
-            "inline": True
-        })
-
-        # Field: Repository
-        embed["fields"].append({
-            "name": "Repository",
-            "value": f"[{repo.get('full_name', 'Unknown')}]({repo.get('html_url', '#')})",
-            "inline": True
-        })
-
-        # Field: Reason for notification
-        reason = notification.get('reason', 'unknown')
-        embed["fields"].append({
-            "name": "Reason",
-            "value": reason,
-            "inline": True
-        })
-        
-        # Field: Last Activity Time (relative)
-        if notification.get('updated_at'):
-            dt_obj = datetime.fromisoformat(notification['updated_at'].replace('Z', '+00:00'))
-            timestamp = int(dt_obj.timestamp())
-            embed["fields"].append({
-                "name": "Last Activity",
-                "value": f"<t:{timestamp}:R>",
-                "inline": True
-            })
-
-        # Add status field (status_value was determined above during color selection)
-        embed["fields"].append({
-            "name": "Status",
-            "value": status_value,
-            "inline": True
-        })
-
-        # --- Add comment content if available ---
-        comment_data = self.get_comment_content(notification)
-        if comment_data:
-            comment_text = comment_data['content']
-            comment_author = comment_data['author']
-            comment_url = comment_data['url']
+    def _retry_after_seconds(self, response: requests.Response, default: float) -> float:
+        """Read how long Discord asked us to wait from a 429 response."""
+        retry_after = response.headers.get('Retry-After')
+        try:
+            retry_after = self._json(response).get('retry_after', retry_after)
+        except (ValueError, AttributeError):
+            pass
+        try:
+            return max(float(retry_after), 0.0)
+        except (TypeError, ValueError):
+            return default
+
+    def _post_to_discord(self, embeds: List[Dict], batch_number: int) -> bool:
+        """POST one batch of embeds, waiting only as long as Discord's rate limit headers require."""
+        logger.info("\nSending batch %s to Discord (%s notifications)...", batch_number, len(embeds))
+        discord_payload = {
+            "embeds": embeds
+        }
+        backoff = 1.0
+        
+        for attempt in range(self.DISCORD_MAX_RETRIES + 1):
+            try:
+                with self._discord_lock:
+                    # Wait out a rate limit bucket the previous batch used up, if any
+                    wait = self._discord_ready_at - time.monotonic()
+                    if wait > 0:
+                        logger.info("Discord rate limit reached, waiting %.2f seconds before next batch...", wait)
+                        time.sleep(wait)
+                    response = self.discord_session.post(
+                        self.discord_webhook_url,
+                        data=orjson.dumps(discord_payload)
+                    )
+                if response.status_code == 429 and attempt < self.DISCORD_MAX_RETRIES:
+                    retry_after = self._retry_after_seconds(response, backoff)
+                    logger.warning("Rate limited by Discord, retrying in %.2f seconds...", retry_after)
+                    time.sleep(retry_after)
+                    backoff *= 2
+                    continue
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.error("ERROR sending to Discord: %s", e)
+                if hasattr(e, 'response') and e.response is not None:
+                    logger.error("Error response status: %s", e.response.status_code)
+                    logger.error("Error response body: %s", e.response.text)
+                return False
+            
+            logger.info("SUCCESS: Sent %s notifications to Discord (Status: %s)", len(embeds), response.status_code)
             
-            # Format the comment content
-            embed["fields"].append({
-                "name": f"💬 Latest Comment by @{comment_author}",
-                "value": f"```\n{comment_text}\n```\n[View Comment]({comment_url})",
-                "inline": False
-            })
+            # When this request used up the webhook's rate limit bucket, the next batch (if there
+            # is one) waits for the reset; the last batch of a run doesn't wait at all
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                try:
+                    reset_after = float(response.headers.get('X-RateLimit-Reset-After', '0'))
+                except ValueError:
+                    reset_after = backoff
+                self._discord_ready_at = time.monotonic() + reset_after
+            return True
+        
+        return False
 
-        return embed
+    def _send_batch(self, embeds: List[Dict], notifications: List[Dict], batch_number: int,
+                    send_failed: threading.Event):
+        """Post a batch unless an earlier one failed; flag the failure so later batches are dropped.
+
+        The batch's notifications (including ones that produced no embed) are recorded as sent
+        as soon as it is delivered, so a later failure doesn't repost them on the next run.
+        """
+        if send_failed.is_set():
+            return
+        if embeds and not self._post_to_discord(embeds, batch_number):
+            send_failed.set()
+            return
+        self.record_sent(notifications)
 
     def send_to_discord(self, notifications: List[Dict]) -> bool:
         """Send notifications to Discord, formatting each one."""
-        print("\n" + "="*50)
-        print("STEP 2: FORMATTING AND SENDING TO DISCORD")
-        print("="*50)
+        logger.info("\n" + "="*50)
+        logger.info("STEP 2: FORMATTING AND SENDING TO DISCORD")
+        logger.info("="*50)
         
         if not notifications:
-            print("No new notifications to send")
+            logger.info("No new notifications to send")
             return True
         
-        print(f"Processing {len(notifications)} notifications for Discord...")
+        logger.info("Processing %s notifications for Discord...", len(notifications))
         
         # Sort notifications by time (oldest first) to send in chronological order
         notifications.sort(key=lambda n: n['updated_at'])
         
         embeds_to_send = []
+        batch_notifications = []
+        batch_chars = 0
         batch_count = 0
+        send_failed = threading.Event()
         
-        for i, notif in enumerate(notifications):
-            print(f"\n--- Formatting notification {i+1} for Discord ---")
-            pprint.pprint(notif, depth=2)
-            embed = self.format_notification_for_discord(notif)
+        # Start every GitHub lookup up front on a worker pool so details and comments of all
+        # notifications are fetched concurrently. Embeds are still built in order, and later
+        # lookups keep running while earlier batches are posted or rate limited.
+        executor = ThreadPoolExecutor(max_workers=self.GITHUB_MAX_WORKERS)
+        # Batches are posted from a single background thread: formatting never waits on Discord,
+        # while messages still arrive in chronological order, one request at a time
+        discord_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            self._prefetch_subject_details(executor, notifications)
+            lookups = [self._start_lookups(executor, n) for n in notifications]
             
-            if embed: # Only add if embed is not None
-                embeds_to_send.append(embed)
-                
-            if len(embeds_to_send) >= 10:
-                batch_count += 1
-                discord_payload = {
-                    "embeds": embeds_to_send
-                }
+            for i, (notif, (details_future, comment_futures)) in enumerate(zip(notifications, lookups)):
+                if send_failed.is_set():
+                    break
                 
-                print(f"\nSending batch {batch_count} to Discord ({len(embeds_to_send)} notifications)...")
-                try:
-                    response = requests.post(
-                        self.discord_webhook_url,
-                        json=discord_payload,
-                        headers={'Content-Type': 'application/json'}
-                    )
-                    response.raise_for_status()
-                    print(f"SUCCESS: Sent {len(embeds_to_send)} notifications to Discord (Status: {response.status_code})")
-                    embeds_to_send = [] # Clear the batch
-                    print("Waiting 1 second before next batch...")
-                    time.sleep(1)
-                except requests.exceptions.RequestException as e:
-                    print(f"ERROR sending to Discord: {e}")
-                    if hasattr(e, 'response') and e.response is not None:
-                        print(f"Error response status: {e.response.status_code}")
-                        print(f"Error response body: {e.response.text}")
-                    return False
-        
-        # Send any remaining embeds
-        if embeds_to_send:
-            batch_count += 1
-            discord_payload = {
-                "embeds": embeds_to_send
-            }
-            print(f"\nSending final batch {batch_count} to Discord ({len(embeds_to_send)} notifications)...")
-            try:
-                response = requests.post(
-                    self.discord_webhook_url,
-                    json=discord_payload,
-                    headers={'Content-Type': 'application/json'}
+                # Parsed once here for both the comment matching and the embed
+                updated_ts = parse_github_timestamp(notif['updated_at'])
+                embed = self.format_notification_for_discord(
+                    notif,
+                    details=details_future.result() if details_future else None,
+                    comment_data=self.get_comment_content(
+                        [c for future in comment_futures for c in future.result()], updated_ts
+                    ) if comment_futures else None,
+                    updated_ts=updated_ts
                 )
-                response.raise_for_status()
-                print(f"SUCCESS: Sent {len(embeds_to_send)} notifications to Discord (Status: {response.status_code})")
-            except requests.exceptions.RequestException as e:
-                print(f"ERROR sending to Discord: {e}")
-                if hasattr(e, 'response') and e.response is not None:
-                    print(f"Error response status: {e.response.status_code}")
-                    print(f"Error response body: {e.response.text}")
-                return False
-            except requests.exceptions.RequestException as e:
-                print(f"ERROR sending to Discord: {e}")
-                if hasattr(e, 'response') and e.response is not None:
-                    print(f"Error response status: {e.response.status_code}")
-                    print(f"Error response body: {e.response.text}")
-                return False
+                if logger.isEnabledFor(logging.DEBUG):
+                    import pprint  # Only needed for debug dumps
+                    logger.debug("\n--- Formatted notification %d for Discord ---\n%s", i+1, pprint.pformat(notif, depth=2))
+                
+                # Pack embeds greedily: a batch is sent once it holds 10 embeds, or earlier when
+                # the next embed would take it past Discord's total character limit
+                embed_chars = self._embed_length(embed) if embed else 0
+                if embeds_to_send and (len(embeds_to_send) >= self.DISCORD_MAX_EMBEDS
+                                       or batch_chars + embed_chars > self.DISCORD_MAX_EMBED_CHARS):
+                    batch_count += 1
+                    discord_executor.submit(self._send_batch, embeds_to_send, batch_notifications,
+                                            batch_count, send_failed)
+                    embeds_to_send = [] # Start a new batch
+                    batch_notifications = []
+                    batch_chars = 0
+                
+                batch_notifications.append(notif)
+                if embed: # Only add if embed is not None
+                    embeds_to_send.append(embed)
+                    batch_chars += embed_chars
+            
+            # Send any remaining embeds (or just record trailing notifications that were skipped)
+            if batch_notifications and not send_failed.is_set():
+                if embeds_to_send:
+                    batch_count += 1
+                discord_executor.submit(self._send_batch, embeds_to_send, batch_notifications,
+                                        batch_count, send_failed)
+        finally:
+            # Don't keep enriching notifications we are no longer going to send
+            executor.shutdown(wait=True, cancel_futures=True)
+            discord_executor.shutdown(wait=True)
         
-        return True
+        return not send_failed.is_set()
 
     def run(self):
         """Main execution function"""
-        print("\n" + "="*60)
-        print("GITHUB NOTIFICATIONS TO DISCORD BOT - STARTING")
-        print("="*60)
+        logger.info("\n" + "="*60)
+        logger.info("GITHUB NOTIFICATIONS TO DISCORD BOT - STARTING")
+        logger.info("="*60)
+        
+        wait = self.poll_wait_remaining()
+        if wait > 0 and self.wait_for_poll_interval:
+            logger.info("GitHub asked for at most one poll every %s seconds; waiting %.0f seconds before polling...",
+                        self.poll_state.get('poll_interval'), wait)
+            time.sleep(wait)
+        elif wait > 0:
+            logger.info("GitHub asked for at most one poll every %s seconds; next poll allowed in %.0f seconds.",
+                        self.poll_state.get('poll_interval'), wait)
+            logger.info("FINAL RESULT: Skipped this run.")
+            return
         
         notifications = self.get_notifications()
+        if notifications is None:
+            logger.info("\n" + "="*60)
+            logger.error("FINAL RESULT: Could not fetch all notifications; nothing was sent or saved.")
+            sys.exit(1)
+        notifications = self.select_new_notifications(notifications)
         
         if notifications:
             success = self.send_to_discord(notifications)
+            self.save_subject_details_cache()
+            # Batches delivered before a failure stay recorded, so a rerun won't post them twice
+            self.save_sent_notifications()
             if success:
-                print("\n" + "="*60)
-                print("FINAL RESULT: Successfully processed all notifications.")
+                self.save_notifications_cache()
+                logger.info("\n" + "="*60)
+                logger.info("FINAL RESULT: Successfully processed all notifications.")
             else:
-                print("\n" + "="*60)
-                print("FINAL RESULT: Some notifications failed to send.")
+                logger.info("\n" + "="*60)
+                logger.error("FINAL RESULT: Some notifications failed to send.")
                 sys.exit(1)
         else:
-            print("\n" + "="*60)
-            print("FINAL RESULT: No new notifications found.")
+            self.save_notifications_cache()
+            logger.info("\n" + "="*60)
+            logger.info("FINAL RESULT: No new notifications found.")
 
 if __name__ == "__main__":
+    log_level = logging.getLevelName(os.getenv('LOG_LEVEL', 'INFO').upper())
+    logging.basicConfig(level=log_level if isinstance(log_level, int) else logging.INFO,
+                        format='%(message)s', stream=sys.stdout)
     try:
         bot = GitHubNotificationBot()
         bot.run()
     except Exception as e:
-        print(f"FATAL ERROR running notification bot: {e}")
+        logger.error("FATAL ERROR running notification bot: %s", e)
         sys.exit(1)
\ No newline at end of file
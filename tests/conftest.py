@@ -0,0 +1,21 @@
+"""Shared fixtures for the notification bot tests."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notification_checker  # noqa: E402
+
+
+@pytest.fixture
+def bot(monkeypatch, tmp_path):
+    """A bot with test credentials and its state in a temporary directory."""
+    monkeypatch.setenv('PRIVATE_GITHUB_TOKEN', 'test-token')
+    monkeypatch.setenv('DISCORD_WEBHOOK_URL', 'https://discord.com/api/webhooks/1/test')
+    monkeypatch.setenv('STATE_DIR', str(tmp_path))
+    for name in ('LAST_CHECK_TIME', 'NOTIFY_TYPES', 'ENRICH_CHECK_SUITES', 'GITHUB_OUTPUT', 'GITHUB_EVENT_NAME'):
+        monkeypatch.delenv(name, raising=False)
+    return notification_checker.GitHubNotificationBot()
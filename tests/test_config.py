@@ -0,0 +1,23 @@
+"""Validation of the LAST_CHECK_TIME setting (GitHubNotificationBot.__init__)."""
+
+import pytest
+
+import notification_checker
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2026-10-14T10:00:05Z', '2026-10-14T10:00:05Z'),
+    ('2026-10-14T10:00:05+02:00', '2026-10-14T10:00:05+02:00'),
+    ('2026-02-30T25:61:00Z', None),
+    ('2026-10-14 10:00:05', None),
+    ('yesterday', None),
+    ('', None),
+])
+def test_last_check_time_is_validated_once(bot, monkeypatch, value, expected):
+    monkeypatch.setenv('LAST_CHECK_TIME', value)
+
+    configured = notification_checker.GitHubNotificationBot()
+
+    assert configured.last_check_time == expected
+    # Comment listings only get a lower bound from a valid last check
+    assert (configured.comments_since is None) == (expected is None)
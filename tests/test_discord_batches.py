@@ -0,0 +1,71 @@
+"""Packing of formatted embeds into Discord messages (send_to_discord)."""
+
+
+def make_notifications(count, subject_type='Release'):
+    return [{
+        'id': str(i),
+        'updated_at': '2026-10-14T10:00:%02dZ' % i,
+        'reason': 'subscribed',
+        'subject': {'type': subject_type, 'title': 'Title %d' % i, 'url': None},
+        'repository': {'full_name': 'octo/app'},
+    } for i in range(count)]
+
+
+def record_posts(bot, monkeypatch, succeed=lambda batch_number: True):
+    """Replace the webhook POST with one that records each batch's embeds."""
+    batches = []
+
+    def post(embeds, batch_number):
+        batches.append(embeds)
+        return succeed(batch_number)
+    monkeypatch.setattr(bot, '_post_to_discord', post)
+    return batches
+
+
+def test_batches_hold_at_most_ten_embeds(bot, monkeypatch):
+    batches = record_posts(bot, monkeypatch)
+
+    assert bot.send_to_discord(make_notifications(23))
+
+    assert [len(batch) for batch in batches] == [10, 10, 3]
+    # Chronological order is kept across batches
+    assert [embed['title'] for batch in batches for embed in batch] == ['Title %d' % i for i in range(23)]
+    assert len(bot.sent_notifications) == 23
+
+
+def test_batches_stay_under_the_character_limit(bot, monkeypatch):
+    batches = record_posts(bot, monkeypatch)
+    # 1100 characters each: five fit in 6000, a sixth would not
+    monkeypatch.setattr(bot, 'format_notification_for_discord',
+                        lambda n, **kwargs: None if n['id'] == '3' else {'title': 'x' * 1100, 'fields': []})
+
+    assert bot.send_to_discord(make_notifications(13))
+
+    assert [sum(map(bot._embed_length, batch)) for batch in batches] == [5500, 5500, 2200]
+    assert all(sum(map(bot._embed_length, batch)) <= bot.DISCORD_MAX_EMBED_CHARS for batch in batches)
+    # Skipped notifications (no embed) are still recorded with their batch
+    assert len(bot.sent_notifications) == 13
+
+
+def test_delivered_batches_stay_recorded_after_a_failure(bot, monkeypatch):
+    batches = record_posts(bot, monkeypatch, succeed=lambda batch_number: batch_number == 1)
+
+    assert not bot.send_to_discord(make_notifications(25))
+
+    # The second batch failed, so the third one was never posted
+    assert [len(batch) for batch in batches] == [10, 10]
+    assert sorted(bot.sent_notifications, key=int) == [str(i) for i in range(10)]
+
+
+def test_long_comments_fit_the_field_limit(bot):
+    comment_url = 'https://github.com/octo-org/octo-repository/pull/12345#discussion_r1234567890'
+    notification = make_notifications(1, 'PullRequest')[0]
+    comment = bot.get_comment_content(
+        [{'body': 'x' * 5000, 'author': 'octocat', 'url': comment_url, 'created_at': 0.0}], 0.0)
+
+    embed = bot.format_notification_for_discord(notification, comment_data=comment)
+
+    value = embed['fields'][-1]['value']
+    assert len(value) == bot.DISCORD_MAX_FIELD_CHARS
+    assert value.endswith(f"...\n```\n[View Comment]({comment_url})")
+    assert all(len(field['value']) <= bot.DISCORD_MAX_FIELD_CHARS for field in embed['fields'])
@@ -0,0 +1,99 @@
+"""Fetching notifications page by page, and what a run persists about it (get_notifications, run)."""
+
+import orjson
+import pytest
+
+import notification_checker
+
+NOTIFICATIONS_URL = 'https://api.github.com/notifications'
+DATE = 'Wed, 14 Oct 2026 10:00:05 GMT'
+
+
+def make_notifications(count):
+    """Notifications newest first, as GitHub lists them."""
+    return [{
+        'id': str(i),
+        'updated_at': '2026-10-%02dT%02d:%02d:00Z' % (1 + i // 1440, i // 60 % 24, i % 60),
+        'reason': 'subscribed',
+        'subject': {'type': 'Release', 'title': 'Title %d' % i, 'url': None},
+        'repository': {'full_name': 'octo/app'},
+    } for i in reversed(range(count))]
+
+
+def mock_pages(requests_mock, notifications, per_page=50, failing_page=None):
+    pages = [notifications[i:i + per_page] for i in range(0, len(notifications), per_page)]
+    for number, page in enumerate(pages, 1):
+        url = NOTIFICATIONS_URL if number == 1 else f'{NOTIFICATIONS_URL}?page={number}'
+        headers = {'Date': DATE, 'ETag': '"etag"'}
+        if number < len(pages):
+            headers['Link'] = f'<{NOTIFICATIONS_URL}?page={number + 1}>; rel="next"'
+        if number == failing_page:
+            requests_mock.get(url, status_code=500)
+        else:
+            requests_mock.get(url, json=page, headers=headers, complete_qs=number > 1)
+
+
+@pytest.fixture
+def run_bot(monkeypatch, tmp_path, requests_mock):
+    """Run a fresh bot (sharing state between runs) and return its step outputs."""
+    monkeypatch.setenv('PRIVATE_GITHUB_TOKEN', 'test-token')
+    monkeypatch.setenv('DISCORD_WEBHOOK_URL', 'https://discord.com/api/webhooks/1/test')
+    monkeypatch.setenv('STATE_DIR', str(tmp_path / 'state'))
+    requests_mock.post('https://discord.com/api/webhooks/1/test', status_code=204)
+
+    def run():
+        output = tmp_path / 'output'
+        output.write_text('')
+        monkeypatch.setenv('GITHUB_OUTPUT', str(output))
+        bot = notification_checker.GitHubNotificationBot()
+        # Every run is a fresh poll
+        bot.poll_state = {}
+        bot.run()
+        return dict(line.split('=', 1) for line in output.read_text().splitlines())
+    return run
+
+
+def posted_titles(requests_mock):
+    return [embed['title'] for r in requests_mock.request_history if r.method == 'POST'
+            for embed in orjson.loads(r.body)['embeds']]
+
+
+def test_all_pages_are_fetched_and_handled(run_bot, requests_mock, tmp_path):
+    mock_pages(requests_mock, make_notifications(120))
+
+    outputs = run_bot()
+
+    assert sorted(posted_titles(requests_mock)) == sorted('Title %d' % i for i in range(120))
+    assert outputs['check_time'] == '2026-10-14T10:00:05Z'
+    cache = orjson.loads((tmp_path / 'state' / 'notifications_cache.json').read_bytes())
+    assert cache['etag'] == '"etag"'
+
+
+def test_backlog_beyond_the_cap_is_sent_oldest_first_over_several_runs(run_bot, requests_mock, tmp_path):
+    mock_pages(requests_mock, make_notifications(400))
+
+    outputs = run_bot()
+    first_run = posted_titles(requests_mock)
+
+    # The oldest 300 go out first; LAST_CHECK_TIME and the validators stay put
+    assert first_run == ['Title %d' % i for i in range(300)]
+    assert 'check_time' not in outputs
+    assert not (tmp_path / 'state' / 'notifications_cache.json').exists()
+
+    requests_mock.reset_mock()
+    outputs = run_bot()
+
+    assert posted_titles(requests_mock) == ['Title %d' % i for i in range(300, 400)]
+    assert outputs['check_time'] == '2026-10-14T10:00:05Z'
+    assert (tmp_path / 'state' / 'notifications_cache.json').exists()
+
+
+def test_failed_page_fails_the_run_without_saving_anything(run_bot, requests_mock, tmp_path):
+    mock_pages(requests_mock, make_notifications(120), failing_page=2)
+
+    with pytest.raises(SystemExit) as exit_info:
+        run_bot()
+
+    assert exit_info.value.code == 1
+    assert posted_titles(requests_mock) == []
+    assert sorted(p.name for p in (tmp_path / 'state').iterdir()) == ['poll_state.json']
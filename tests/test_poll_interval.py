@@ -0,0 +1,36 @@
+"""Runs that come sooner than GitHub's poll interval (run)."""
+
+import time
+
+import pytest
+
+import notification_checker
+
+
+def run_early(bot, monkeypatch):
+    """Run a bot whose last poll was 20 seconds ago (60 second interval); return its sleeps and polls."""
+    bot.poll_state = {'last_poll_at': time.time() - 20, 'poll_interval': 60}
+    sleeps = []
+    monkeypatch.setattr(notification_checker.time, 'sleep', sleeps.append)
+    polls = []
+    monkeypatch.setattr(bot, 'get_notifications', lambda: polls.append(True) or [])
+    bot.run()
+    return sleeps, polls
+
+
+def test_scheduled_run_is_skipped(bot, monkeypatch):
+    sleeps, polls = run_early(bot, monkeypatch)
+
+    assert sleeps == [] and polls == []
+
+
+@pytest.mark.parametrize('event', ['repository_dispatch', 'workflow_dispatch'])
+def test_dispatched_run_waits_for_the_poll_interval(bot, monkeypatch, event):
+    # The bot fixture already set up the environment; only the triggering event differs
+    monkeypatch.setenv('GITHUB_EVENT_NAME', event)
+    dispatched_bot = notification_checker.GitHubNotificationBot()
+
+    sleeps, polls = run_early(dispatched_bot, monkeypatch)
+
+    assert len(sleeps) == 1 and 35 < sleeps[0] <= 40
+    assert polls == [True]
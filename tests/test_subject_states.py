@@ -0,0 +1,116 @@
+"""Batched GraphQL lookups of issue/PR state (_query_subject_states, _prefetch_subject_details)."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import pytest
+
+import notification_checker
+
+GRAPHQL_URL = notification_checker.GitHubNotificationBot.GRAPHQL_URL
+PR_1 = 'https://api.github.com/repos/octo/app/pulls/1'
+ISSUE_2 = 'https://api.github.com/repos/octo/lib/issues/2'
+PR_3 = 'https://api.github.com/repos/octo/app/pulls/3'
+SUBJECTS = {
+    PR_1: ('octo/app', 'pulls', '1'),
+    ISSUE_2: ('octo/lib', 'issues', '2'),
+    PR_3: ('octo/app', 'pulls', '3'),
+}
+
+
+def make_notification(url, subject_type='PullRequest'):
+    return {
+        'id': url.rsplit('/', 1)[-1],
+        'updated_at': '2026-10-14T10:00:00Z',
+        'reason': 'subscribed',
+        'subject': {'type': subject_type, 'title': 'Title', 'url': url},
+        'repository': {'full_name': 'octo/app'},
+    }
+
+
+def test_groups_subjects_by_repository_and_maps_aliases_back(bot, requests_mock):
+    requests_mock.post(GRAPHQL_URL, json={'data': {
+        'r0': {
+            's0': {'state': 'MERGED', 'merged': True, 'isDraft': False},
+            's2': {'state': 'OPEN', 'merged': False, 'isDraft': True},
+        },
+        'r1': {'s1': {'state': 'CLOSED'}},
+    }})
+
+    results = bot._query_subject_states(SUBJECTS)
+
+    assert results == {
+        PR_1: {'state': 'closed', 'merged': True, 'draft': False},
+        ISSUE_2: {'state': 'closed'},
+        PR_3: {'state': 'open', 'merged': False, 'draft': True},
+    }
+    request = orjson.loads(requests_mock.last_request.body)
+    assert request['variables'] == {'o0': 'octo', 'n0': 'app', 'o1': 'octo', 'n1': 'lib'}
+    app_selection, lib_selection = request['query'].split(' r1: ')
+    assert 's0: issueOrPullRequest(number: 1)' in app_selection
+    assert 's2: issueOrPullRequest(number: 3)' in app_selection
+    assert 's1: issueOrPullRequest(number: 2)' in lib_selection
+    assert requests_mock.last_request.headers['Content-Type'] == 'application/json'
+    assert requests_mock.call_count == 1
+
+
+def test_null_subjects_and_repositories_are_left_out(bot, requests_mock):
+    requests_mock.post(GRAPHQL_URL, json={'data': {
+        'r0': {'s0': None, 's2': {'state': 'OPEN', 'merged': False, 'isDraft': False}},
+        'r1': None,
+    }})
+
+    results = bot._query_subject_states(SUBJECTS)
+
+    assert results == {PR_3: {'state': 'open', 'merged': False, 'draft': False}}
+
+
+@pytest.mark.parametrize('graphql_response', [
+    {'status_code': 502},
+    {'json': {'data': None, 'errors': [{'message': 'Something went wrong'}]}},
+    {'text': 'not json'},
+])
+def test_falls_back_to_rest_when_the_query_fails(bot, requests_mock, graphql_response):
+    requests_mock.post(GRAPHQL_URL, **graphql_response)
+    for url in SUBJECTS:
+        requests_mock.get(url, json={'state': 'open', 'merged': False, 'draft': False, 'title': 'ignored'})
+
+    results = bot._query_subject_states(SUBJECTS)
+
+    assert set(results) == set(SUBJECTS)
+    assert all(details['state'] == 'open' for details in results.values())
+    assert [r.url for r in requests_mock.request_history if r.method == 'GET'] == list(SUBJECTS)
+
+
+def test_prefetch_feeds_the_details_memo(bot, requests_mock):
+    requests_mock.post(GRAPHQL_URL, json={'data': {
+        'r0': {'s0': {'state': 'MERGED', 'merged': True, 'isDraft': False}, 's2': None},
+        'r1': {'s1': {'state': 'OPEN'}},
+    }})
+    notifications = [make_notification(PR_1), make_notification(ISSUE_2, 'Issue'),
+                     make_notification(PR_3), make_notification(PR_1)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        bot._prefetch_subject_details(executor, notifications)
+        details = [bot._start_lookups(executor, n)[0].result() for n in notifications]
+
+    assert details == [
+        {'state': 'closed', 'merged': True, 'draft': False},
+        {'state': 'open'},
+        None,
+        {'state': 'closed', 'merged': True, 'draft': False},
+    ]
+    # One query for everything, and no REST lookups
+    assert [r.method for r in requests_mock.request_history] == ['POST']
+
+
+def test_prefetch_fails_pending_futures_on_unexpected_errors(bot, monkeypatch):
+    def broken_query(subjects):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(bot, '_query_subject_states', broken_query)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        bot._prefetch_subject_details(executor, [make_notification(PR_1)])
+
+    with pytest.raises(RuntimeError, match='boom'):
+        bot._details_cache[PR_1].result(timeout=1)